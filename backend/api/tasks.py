@@ -0,0 +1,15 @@
+import subprocess
+from pathlib import Path
+
+from celery import shared_task
+
+TRAIN_SCRIPT = Path(__file__).resolve().parents[1] / "scripts" / "train_reopen_classifier.py"
+
+
+@shared_task
+def retrain_task(csv_path):
+    """Run the reopen-risk training script on a worker and report its outcome."""
+    proc = subprocess.run(
+        ["python", str(TRAIN_SCRIPT), csv_path], capture_output=True, text=True
+    )
+    return {"returncode": proc.returncode, "stdout": proc.stdout, "stderr": proc.stderr}
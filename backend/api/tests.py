@@ -1,3 +1,406 @@
-from django.test import TestCase
+import importlib.util
+import io
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow.csv as pacsv
+from celery import states
+from celery.backends.cache import CacheBackend
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from sklearn.dummy import DummyClassifier
+from xgboost import XGBClassifier
+
+from api import views
+from core import celery_app
+from core.pm4py_utils import directly_follows
+from events.models import Case, Event
+
+
+def load_script(name):
+    """Import one of backend/scripts/*.py, which import their siblings by name."""
+    scripts = Path(settings.BASE_DIR) / "scripts"
+    spec = importlib.util.spec_from_file_location(name, scripts / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    with mock.patch.object(sys, "path", [str(scripts), *sys.path]):
+        spec.loader.exec_module(module)
+    return module
+
+
+class AuthenticatedAPITestCase(APITestCase):
+    """Logged-in client, and no discovery results cached from other tests."""
+    def setUp(self):
+        # Rolled-back tests can reuse event ids, so the (max id, count) log
+        # fingerprint alone doesn't keep cached α-miner results apart
+        cache.clear()
+        self.user = User.objects.create_user("analyst", password="pw")
+        self.client.force_authenticate(self.user)
+
+
+class DirectlyFollowsTests(APITestCase):
+    def event_df(self, rows):
+        return pd.DataFrame(rows, columns=["case:concept:name", "concept:name", "time:timestamp"])
+
+    def test_counts_pairs_within_cases(self):
+        df = self.event_df([
+            ("c1", "A", 1), ("c1", "B", 2), ("c1", "C", 3),
+            ("c2", "A", 1), ("c2", "C", 2),
+        ])
+        dfg, starts, ends = directly_follows(df)
+        self.assertEqual(dfg, {("A", "B"): 1, ("B", "C"): 1, ("A", "C"): 1})
+        self.assertEqual(starts, {"A": 2})
+        self.assertEqual(ends, {"C": 2})
+
+    def test_empty_log(self):
+        self.assertEqual(directly_follows(self.event_df([])), ({}, {}, {}))
+
+
+class CaseAggregatesTests(APITestCase):
+    def test_rows_sorted_whatever_the_block_count(self):
+        event_log = load_script("event_log")
+        train = load_script("train_reopen_classifier")
+        text = "case_id,activity,timestamp,resource\n" + "".join(
+            f"{c},Open,2024-01-01T09:00:00,r1\n" for c in ["b", "a", "c", "a", "b"]
+        )
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as f:
+            f.write(text)
+            f.flush()
+            one_block = event_log.case_aggregates(f.name, train.CSV_CONVERT, train.case_aggs)
+            with mock.patch.object(event_log, "CSV_BLOCK_SIZE", 64):
+                many_blocks = event_log.case_aggregates(f.name, train.CSV_CONVERT, train.case_aggs)
+        self.assertEqual(one_block.index.tolist(), ["a", "b", "c"])
+        pd.testing.assert_frame_equal(one_block, many_blocks)
+
+
+class EmptyLogTests(AuthenticatedAPITestCase):
+    def test_performance_with_no_events(self):
+        resp = self.client.get(reverse("api-performance"))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data["throughput"], [])
+        self.assertEqual(resp.data["conformance"]["total_traces"], 0)
+
+
+class ProcessMapTests(AuthenticatedAPITestCase):
+    """/api/process-map/ with a stand-in `dot` script on PATH."""
+    def fake_dot(self, script):
+        bin_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(bin_dir.cleanup)
+        dot = Path(bin_dir.name) / "dot"
+        dot.write_text(f"#!/bin/sh\n{script}\n")
+        dot.chmod(0o755)
+        patcher = mock.patch.dict(os.environ, {"PATH": f"{bin_dir.name}:{os.environ['PATH']}"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_png(self):
+        resp = self.client.get(reverse("api-process-map"))
+        body = b"".join(resp.streaming_content) if resp.streaming else None
+        return resp, body
+
+    def test_streams_and_caches_png(self):
+        self.fake_dot("cat > /dev/null; printf PNGDATA")
+        resp, body = self.get_png()
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(body, b"PNGDATA")
+
+        self.fake_dot("exit 1")   # served from the cache, dot isn't run again
+        self.assertEqual(self.get_png()[1], b"PNGDATA")
+
+    def test_dot_fails(self):
+        self.fake_dot("cat > /dev/null; echo 'Error: syntax error' >&2; exit 1")
+        with self.assertLogs("core.pm4py_utils", "ERROR"):
+            resp, _ = self.get_png()
+        self.assertEqual(resp.status_code, 500)
+        self.assertIn("Error: syntax error", resp.data["error"])
+
+    def test_dot_exits_before_reading(self):
+        self.fake_dot("echo 'Error: out of memory' >&2; exit 2")
+        # More than a pipe buffer, so the write hits the closed pipe
+        with mock.patch("core.pm4py_utils.cached_alpha_dot", return_value="x" * (1 << 20)), \
+                self.assertLogs("core.pm4py_utils", "ERROR"):
+            resp, _ = self.get_png()
+        self.assertEqual(resp.status_code, 500)
+        self.assertIn("exit status 2", resp.data["error"])
+
+    def test_dot_missing(self):
+        with mock.patch.dict(os.environ, {"PATH": ""}):
+            resp, _ = self.get_png()
+        self.assertEqual(resp.status_code, 503)
+
+
+# (case, activity, timestamp): uneven gaps, a case running past midnight
+# and a single-event case
+AGGREGATE_EVENTS = [
+    ("c1", "Open",  datetime(2024, 1, 1, 9, 0, tzinfo=timezone.utc)),
+    ("c1", "Fix",   datetime(2024, 1, 1, 10, 30, tzinfo=timezone.utc)),
+    ("c1", "Close", datetime(2024, 1, 2, 8, 15, tzinfo=timezone.utc)),
+    ("c2", "Open",  datetime(2024, 1, 1, 22, 0, tzinfo=timezone.utc)),
+    ("c2", "Fix",   datetime(2024, 1, 2, 1, 45, 30, tzinfo=timezone.utc)),
+    ("c2", "Fix",   datetime(2024, 1, 2, 3, 0, tzinfo=timezone.utc)),
+    ("c2", "Close", datetime(2024, 1, 3, 12, 0, tzinfo=timezone.utc)),
+    ("c3", "Open",  datetime(2024, 1, 3, 7, 20, tzinfo=timezone.utc)),
+]
+
+
+class AggregateViewTests(AuthenticatedAPITestCase):
+    """
+    The SQL aggregations against the pandas computations they replaced,
+    on whichever database backend is configured.
+    """
+    def setUp(self):
+        super().setUp()
+        case_ids = dict.fromkeys(c for c, _, _ in AGGREGATE_EVENTS)
+        cases = {c: Case.objects.create(case_id=c) for c in case_ids}
+        Event.objects.bulk_create([
+            Event(case=cases[c], activity=a, timestamp=ts, resource="r1")
+            for c, a, ts in AGGREGATE_EVENTS
+        ])
+        self.df = pd.DataFrame(AGGREGATE_EVENTS, columns=["case_id", "activity", "timestamp"])
+
+    def test_vendor_has_hours_expression(self):
+        self.assertIn(connection.vendor, views.HOURS_BETWEEN)
+
+    def test_metrics(self):
+        df = self.df.copy()
+        ct = df.groupby("case_id")["timestamp"].agg(start="min", end="max")
+        ct["duration"] = (ct.end - ct.start).dt.total_seconds() / 3600
+        df = df.sort_values(["case_id", "timestamp"])
+        df["next_ts"] = df.groupby("case_id")["timestamp"].shift(-1)
+        df["act_dur"] = (df.next_ts - df.timestamp).dt.total_seconds() / 3600
+        bn = df.dropna(subset=["act_dur"]).groupby("activity").act_dur.mean()
+
+        resp = self.client.get(reverse("api-metrics"))
+        self.assertEqual(resp.status_code, 200)
+        metrics = resp.data["metrics"]
+        self.assertEqual(metrics["total_cases"], ct.shape[0])
+        self.assertEqual(metrics["total_events"], df.shape[0])
+        self.assertAlmostEqual(metrics["avg_cycle_time_hours"], ct.duration.mean(), places=4)
+        self.assertAlmostEqual(metrics["max_cycle_time_hours"], ct.duration.max(), places=4)
+        self.assertEqual([b["activity"] for b in resp.data["bottleneck"]], bn.index.tolist())
+        np.testing.assert_allclose(
+            [b["avg_hours"] for b in resp.data["bottleneck"]], bn.values, atol=1e-4
+        )
+
+    def test_throughput(self):
+        starts = self.df.groupby("case_id").timestamp.min().reset_index(name="start_ts")
+        thr = starts.start_ts.dt.date.value_counts().sort_index()
+        expected = [{"date": str(d), "count": int(c)} for d, c in thr.items()]
+
+        resp = self.client.get(reverse("api-performance"))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data["throughput"], expected)
+
+    def test_activity_frequency(self):
+        df = self.df.assign(date=self.df.timestamp.dt.date)
+        freq = df.groupby(["activity", "date"]).size()
+        expected = [
+            {"activity": a, "date": str(d), "count": int(c)} for (a, d), c in freq.items()
+        ]
+
+        resp = self.client.get(reverse("api-activity-frequency"))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data["activity_counts"], expected)
+
+
+UPLOAD_CSV = """case_id,activity,timestamp,resource
+c1,Open,2024-01-01T09:00:00,alice
+c1,Fix,2024-01-01T10:00:00,bob
+c1,Close,2024-01-01T11:00:00,alice
+c2,Open,2024-01-02T09:00:00,carol
+c2,Close,2024-01-02T12:00:00,carol
+"""
+# Empty cells are missing values: c1 has one resource, c2 one activity
+BLANKS_CSV = """case_id,activity,timestamp,resource
+c1,Open,2024-01-01T09:00:00,
+c1,Fix,2024-01-01T10:00:00,r1
+c2,,2024-01-02T09:00:00,r2
+c2,Open,2024-01-02T10:00:00,r2
+c3,Open,2024-01-03T09:00:00,
+"""
+
+
+class PredictReopenTests(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.model_path = Path(tmp.name) / "reopen_risk_rf.joblib"
+        patcher = mock.patch.object(views, "REOPEN_MODEL_PATH", self.model_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        views._get_reopen_model.cache_clear()
+        self.addCleanup(views._get_reopen_model.cache_clear)
+
+    def save_model(self, model):
+        joblib.dump(model, self.model_path)
+        return model
+
+    def upload(self, text):
+        return self.client.post(
+            reverse("api-predict-reopen"),
+            {"file": SimpleUploadedFile("events.csv", text.encode(), content_type="text/csv")},
+            format="multipart",
+        )
+
+    def test_scores_every_case(self):
+        X = np.array([[3, 3, 2], [2, 2, 1], [6, 4, 3], [1, 1, 1]], dtype=np.float32)
+        model = self.save_model(XGBClassifier(n_estimators=5, max_depth=2).fit(X, [1, 0, 1, 0]))
+
+        resp = self.upload(UPLOAD_CSV)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data["total_events"], 5)
+        self.assertFalse(resp.data["single_class"])
+        self.assertEqual([c["case_id"] for c in resp.data["cases"]], ["c1", "c2"])
+        expected = model.predict_proba(X[:2])[:, 1]
+        np.testing.assert_allclose([c["reopen_risk_prob"] for c in resp.data["cases"]], expected, rtol=1e-6)
+
+    def test_missing_column(self):
+        self.save_model(DummyClassifier().fit([[1, 1, 1]], [0]))
+        resp = self.upload("case_id,activity,timestamp\nc1,Open,2024-01-01T09:00:00\n")
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("resource", resp.data["error"])
+
+    def test_no_file(self):
+        resp = self.client.post(reverse("api-predict-reopen"), {}, format="multipart")
+        self.assertEqual(resp.status_code, 400)
+
+    def test_missing_model(self):
+        resp = self.upload(UPLOAD_CSV)
+        self.assertEqual(resp.status_code, 503)
+        self.assertIn("error", resp.data)
+
+    def test_single_class_model(self):
+        # What train_reopen_classifier.py saves when no case ever reopened
+        self.save_model(DummyClassifier(strategy="prior").fit([[1, 1, 1], [2, 2, 2]], [0, 0]))
+        resp = self.upload(UPLOAD_CSV)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.data["single_class"])
+        self.assertEqual([c["reopen_risk_prob"] for c in resp.data["cases"]], [0.0, 0.0])
+
+    def test_empty_cells_are_missing(self):
+        self.save_model(DummyClassifier(strategy="prior").fit([[1, 1, 1], [2, 2, 2]], [0, 1]))
+        self.assertEqual(self.upload(BLANKS_CSV).status_code, 200)
+
+        # Serving features for the uploaded CSV ...
+        df = pacsv.read_csv(
+            io.BytesIO(BLANKS_CSV.encode()), convert_options=views.UPLOAD_CSV_CONVERT
+        ).to_pandas()
+        served = views._reopen_features(df).set_index("case_id")
+        self.assertEqual(served["unique_resources"].tolist(), [1, 1, 0])
+        self.assertEqual(served["unique_acts"].tolist(), [2, 1, 1])
+        self.assertEqual(served["total_events"].tolist(), [2, 1, 1])
+
+        # ... match what train_reopen_classifier.py computes for the same file
+        train = load_script("train_reopen_classifier")
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as f:
+            f.write(BLANKS_CSV)
+            f.flush()
+            trained = train.case_aggregates(f.name, train.CSV_CONVERT, train.case_aggs)
+        trained = trained.rename(columns={"unique_activities": "unique_acts"})
+        for col in views.REOPEN_FEATURES:
+            self.assertEqual(
+                trained.loc[served.index, col].tolist(), served[col].tolist(), col
+            )
+
+
+# Run tasks in-process and store their results, so the status view can read them
+EAGER_CELERY = {
+    "CELERY_TASK_ALWAYS_EAGER": True,
+    "CELERY_TASK_STORE_EAGER_RESULT": True,
+}
+
+
+class RetrainTests(AuthenticatedAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user.is_staff = True
+        self.user.save()
+
+        previous = {key: celery_app.conf.get(key) for key in EAGER_CELERY}
+        celery_app.conf.update(EAGER_CELERY)
+        self.addCleanup(celery_app.conf.update, previous)
+        # Results go to memory rather than the configured Redis
+        backend = CacheBackend(app=celery_app, backend="memory")
+        for patcher in (
+            mock.patch.object(type(celery_app), "backend", backend),
+            mock.patch.object(views, "CANONICAL_CSV", Path(__file__)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def retrain(self, **run):
+        """POST /api/retrain/ with the training subprocess stubbed out."""
+        with mock.patch("api.tasks.subprocess.run", **run) as run_mock:
+            resp = self.client.post(reverse("api-retrain"))
+        return resp, run_mock
+
+    def status_of(self, task_id):
+        return self.client.get(reverse("api-retrain-status", args=[task_id]))
+
+    def test_queues_task(self):
+        resp, run_mock = self.retrain(
+            return_value=subprocess.CompletedProcess([], 0, "saved\n", "")
+        )
+        self.assertEqual(resp.status_code, 202)
+        self.assertIn("task_id", resp.data)
+        self.assertEqual(run_mock.call_args.args[0][-1], str(Path(__file__)))
+
+    def test_admin_only(self):
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.client.post(reverse("api-retrain")).status_code, 403)
+        self.assertEqual(self.status_of("some-task").status_code, 403)
+
+    def test_missing_csv(self):
+        with mock.patch.object(views, "CANONICAL_CSV", Path("/nonexistent/events.csv")):
+            resp, run_mock = self.retrain()
+        self.assertEqual(resp.status_code, 500)
+        run_mock.assert_not_called()
+
+    def test_status_pending(self):
+        resp = self.status_of("not-run-yet")
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(resp.data["status"], "PENDING")
+
+    def test_status_success(self):
+        resp, _ = self.retrain(return_value=subprocess.CompletedProcess([], 0, "saved\n", ""))
+        resp = self.status_of(resp.data["task_id"])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data["status"], "SUCCESS")
+        self.assertEqual(resp.data["output"], "saved")
+
+    def test_status_script_failed(self):
+        resp, _ = self.retrain(
+            return_value=subprocess.CompletedProcess([], 1, "", "KeyError: 'case_id'\n")
+        )
+        resp = self.status_of(resp.data["task_id"])
+        self.assertEqual(resp.status_code, 500)
+        self.assertEqual(resp.data["status"], "FAILURE")
+        self.assertEqual(resp.data["error"], "KeyError: 'case_id'")
+
+    def test_status_task_raised(self):
+        resp, _ = self.retrain(side_effect=OSError("python not found"))
+        resp = self.status_of(resp.data["task_id"])
+        self.assertEqual(resp.status_code, 500)
+        self.assertEqual(resp.data["status"], "FAILURE")
+        self.assertEqual(resp.data["error"], "python not found")
+
+    def test_status_revoked(self):
+        # What the worker records for a task revoked before it ran
+        celery_app.backend.mark_as_revoked("revoked-task", reason="revoked")
+        resp = self.status_of("revoked-task")
+        self.assertEqual(resp.status_code, 500)
+        self.assertEqual(resp.data["status"], states.REVOKED)
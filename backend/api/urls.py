@@ -1,11 +1,13 @@
 from django.urls import path
-from .views import ActivityFrequencyView, MetricsView, PerformanceView, ProcessMapView, PredictDurationView, RetrainModelView
+from .views import ActivityFrequencyView, MetricsView, PerformanceView, ProcessMapView, PredictDurationView, PredictReopenView, RetrainModelView, RetrainStatusView
 
 urlpatterns = [
     path('metrics/',       MetricsView.as_view(),           name='api-metrics'),
     path('process-map/',   ProcessMapView.as_view(),        name='api-process-map'),
     path('predict-duration/<str:case_id>/', PredictDurationView.as_view(), name='api-predict-duration'),
+    path("predict-reopen/", PredictReopenView.as_view(), name="api-predict-reopen"),
     path("performance/", PerformanceView.as_view(), name="api-performance"),
     path("activity-frequency/", ActivityFrequencyView.as_view(), name="api-activity-frequency"),
     path("retrain/", RetrainModelView.as_view(), name="api-retrain"),
+    path("retrain/<str:task_id>/", RetrainStatusView.as_view(), name="api-retrain-status"),
 ]
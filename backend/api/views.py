@@ -1,135 +1,261 @@
 import io
 import subprocess
+from functools import lru_cache
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import joblib
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from celery.result import AsyncResult
 from django.conf import settings
-from django.http import HttpResponse
+from django.db import connection
+from django.http import StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAdminUser
-from graphviz.backend.execute import ExecutableNotFound
+from sklearn import config_context
 
+from api.tasks import TRAIN_SCRIPT, retrain_task
+from core.pm4py_utils import alpha_png_stream, cached_alpha_net
 from events.models import Event
-from pm4py import convert
-from pm4py.objects.log.util import dataframe_utils
-from pm4py.algo.discovery.alpha import algorithm as alpha_miner
-from pm4py.visualization.petri_net import visualizer as pn_visualizer
-from pm4py.algo.conformance.tokenreplay import algorithm as token_replay
+
+
+DURATION_MODEL_PATH = Path(__file__).resolve().parents[1] / "models" / "case_duration_rf.joblib"
+
+
+def _load_duration_model():
+    """The case-duration model, or None if it hasn't been trained yet."""
+    try:
+        return joblib.load(DURATION_MODEL_PATH)
+    except FileNotFoundError:
+        return None
+
+
+# Loaded at import: gunicorn --preload imports the app in the master, so the
+# workers fork with the unpickled trees already in memory and share those
+# pages copy-on-write instead of each loading a copy. Restart to pick up a
+# retrained model.
+DURATION_MODEL = _load_duration_model()
+
+
+# train_reopen_classifier.py writes its artifact under backend/backend/models
+REOPEN_MODEL_PATH = Path(__file__).resolve().parents[1] / "backend" / "models" / "reopen_risk_rf.joblib"
+REOPEN_FEATURES = ["total_events", "unique_acts", "unique_resources"]
+# Only the columns the reopen features use, repeated strings as dictionaries
+UPLOAD_CSV_CONVERT = pacsv.ConvertOptions(
+    include_columns=["case_id", "activity", "resource"],
+    strings_can_be_null=True,   # empty cells are missing, as with pd.read_csv
+    column_types={
+        col: pa.dictionary(pa.int32(), pa.string())
+        for col in ("case_id", "activity", "resource")
+    },
+)
+
+
+@lru_cache(maxsize=1)
+def _get_reopen_model(mtime_ns):
+    """
+    Load the reopen-risk model once per process. The file's mtime is the
+    cache key, so a model retrained by the worker replaces the old one.
+    """
+    model = joblib.load(REOPEN_MODEL_PATH)
+    # Spread predict_proba over all cores, whatever it was trained with
+    model.n_jobs = -1
+    return model
+
+
+# Largest cases × values table counted with a dense bitmap rather than a sort
+REOPEN_BITMAP_CELLS = 1 << 26
+
+
+def _reopen_features(df):
+    """
+    Per-case event count and distinct activities/resources, in order of first
+    appearance. Each column is factorized once and counted with np.bincount
+    instead of three hash-grouping passes.
+    """
+    case_codes, case_ids = pd.factorize(df["case_id"])
+    n_cases = len(case_ids)
+
+    def per_case(col):
+        codes, values = pd.factorize(df[col])
+        keep = (case_codes >= 0) & (codes >= 0)   # nulls don't count, as in groupby
+        cc, vc = case_codes[keep], codes[keep]
+        count = np.bincount(cc, minlength=n_cases)
+        # One key per (case, value) pair; distinct keys per case = nunique
+        n_values = max(len(values), 1)
+        pairs = cc.astype(np.int64) * n_values + vc
+        if n_cases * n_values <= REOPEN_BITMAP_CELLS:
+            # Few activities/resources: mark pairs in a cases × values bitmap,
+            # one linear pass instead of sorting every event's key
+            seen = np.zeros((n_cases, n_values), dtype=bool)
+            seen.ravel()[pairs] = True
+            distinct = np.count_nonzero(seen, axis=1)
+        else:
+            distinct = np.bincount(np.unique(pairs) // n_values, minlength=n_cases)
+        # Counts come back as int64; int32 halves what the float32 copy reads
+        return count.astype(np.int32), distinct.astype(np.int32)
+
+    total_events, unique_acts = per_case("activity")
+    _, unique_resources = per_case("resource")
+    return pd.DataFrame({
+        "case_id":          np.asarray(case_ids, dtype=object),
+        "total_events":     total_events,
+        "unique_acts":      unique_acts,
+        "unique_resources": unique_resources,
+    })
+
+
+# Hours between two timestamp expressions, per database backend
+HOURS_BETWEEN = {
+    "postgresql": "EXTRACT(epoch FROM {end} - {start}) / 3600",
+    "sqlite":     "(julianday({end}) - julianday({start})) * 24",
+}
 
 
 class MetricsView(APIView):
     """1) Cycle-time metrics & bottleneck."""
     def get(self, request):
-        qs = Event.objects.select_related("case").values(
-            "case__case_id", "activity", "timestamp", "resource"
-        )
-        df = pd.DataFrame.from_records(qs).rename(
-            columns={"case__case_id": "case_id"}
-        )
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
+        hours = HOURS_BETWEEN[connection.vendor]
+        with connection.cursor() as cur:
+            # Cycle-time per case
+            cur.execute(
+                f"SELECT COUNT(*), SUM(n), AVG({hours.format(start='s', end='e')}), "
+                f"MAX({hours.format(start='s', end='e')}) FROM ("
+                "  SELECT COUNT(*) AS n, MIN(timestamp) AS s, MAX(timestamp) AS e "
+                "  FROM events_event GROUP BY case_id"
+                ") ct"
+            )
+            total_cases, total_events, avg_ct, max_ct = cur.fetchone()
+
+            # Bottleneck: mean gap until the next event of the same case
+            cur.execute(
+                f"SELECT activity, AVG({hours.format(start='timestamp', end='next_ts')}) FROM ("
+                "  SELECT activity, timestamp, LEAD(timestamp) OVER ("
+                "    PARTITION BY case_id ORDER BY timestamp"
+                "  ) AS next_ts FROM events_event"
+                ") sub WHERE next_ts IS NOT NULL GROUP BY activity ORDER BY activity"
+            )
+            bottleneck = [
+                {"activity": a, "avg_hours": float(d)} for a, d in cur.fetchall()
+            ]
 
-        # Cycle-time per case
-        ct = df.groupby("case_id")["timestamp"].agg(start="min", end="max")
-        ct["duration"] = (ct.end - ct.start).dt.total_seconds() / 3600
         metrics = {
-            "total_cases":   int(ct.shape[0]),
-            "total_events":  int(df.shape[0]),
-            "avg_cycle_time_hours": float(ct.duration.mean()),
-            "max_cycle_time_hours": float(ct.duration.max()),
+            "total_cases":   int(total_cases),
+            "total_events":  int(total_events or 0),
+            "avg_cycle_time_hours": float(avg_ct) if avg_ct is not None else None,
+            "max_cycle_time_hours": float(max_ct) if max_ct is not None else None,
         }
-
-        # Bottleneck
-        df = df.sort_values(["case_id", "timestamp"])
-        df["next_ts"] = df.groupby("case_id")["timestamp"].shift(-1)
-        df["act_dur"] = (df.next_ts - df.timestamp).dt.total_seconds() / 3600
-        bn = df.dropna(subset=["act_dur"]).groupby("activity").act_dur.mean()
-        bottleneck = [{"activity": a, "avg_hours": float(d)} for a, d in bn.items()]
-
         return Response({"metrics": metrics, "bottleneck": bottleneck})
 
 
 class ProcessMapView(APIView):
     """2) α-miner Petri net PNG."""
     def get(self, request):
-        qs = Event.objects.select_related("case").values(
-            "case__case_id", "activity", "timestamp", "resource"
-        )
-        df = pd.DataFrame.from_records(qs).rename(columns={
-            "case__case_id": "case:concept:name",
-            "activity":      "concept:name",
-            "timestamp":     "time:timestamp",
-            "resource":      "org:resource",
-        })
-        df["time:timestamp"] = pd.to_datetime(df["time:timestamp"])
-        df = dataframe_utils.convert_timestamp_columns_in_df(df).sort_values("time:timestamp")
-
-        log = convert.convert_to_event_log(df)
         try:
-            net, im, fm = alpha_miner.apply(log)
-            gviz       = pn_visualizer.apply(net, im, fm)
-            img_bytes  = gviz.pipe(format="png")
-            return HttpResponse(img_bytes, content_type="image/png")
-        except ExecutableNotFound:
+            png = alpha_png_stream()
+        except FileNotFoundError:
             return Response(
                 {"error": "Graphviz ‘dot’ executable not found."},
                 status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
-        finally:
-            try: gviz.cleanup()
-            except: pass
+        except subprocess.CalledProcessError as e:
+            return Response(
+                {"error": f"Graphviz ‘dot’ failed (exit status {e.returncode}): {e.stderr}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        return StreamingHttpResponse(png, content_type="image/png")
 
 
 class PredictDurationView(APIView):
     """3) Predict case duration."""
     def get(self, request, case_id):
-        model_fp = Path(__file__).resolve().parents[1] / "models" / "case_duration_rf.joblib"
-        model    = joblib.load(model_fp)
-
-        qs = Event.objects.filter(case__case_id=case_id)
-        if not qs.exists():
+        rows = list(
+            Event.objects.filter(case__case_id=case_id).values_list("activity", "resource")
+        )
+        if not rows:
             return Response({"error": "Case not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        df = pd.DataFrame.from_records(qs.values("activity","timestamp","resource"))
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
-        feats = [len(df), df.activity.nunique(), df.resource.nunique()]
-        pred  = model.predict([feats])[0]
+        feats = np.array([[
+            len(rows),
+            len({activity for activity, _ in rows}),
+            len({resource for _, resource in rows}),
+        ]], dtype=np.float32)
+        if DURATION_MODEL is None:
+            return Response(
+                {"error": f"Model not found at {DURATION_MODEL_PATH}; run scripts/train_model.py first."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        pred  = DURATION_MODEL.predict(feats)[0]
         return Response({"case_id": case_id, "predicted_duration_hours": float(pred)})
 
 
+class PredictReopenView(APIView):
+    """
+    POST /api/predict-reopen/
+    Scores every case in an uploaded event-log CSV (multipart field "file")
+    with the reopen-risk model.
+    """
+    def post(self, request):
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response({"error": "No CSV uploaded"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            df = pacsv.read_csv(upload, convert_options=UPLOAD_CSV_CONVERT).to_pandas()
+        except (pa.ArrowInvalid, KeyError) as e:
+            return Response({"error": f"Could not read CSV: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        feat = _reopen_features(df)
+
+        # Bad uploads are rejected before the model is touched. The stat() that
+        # keys the cache doubles as the existence check: no separate exists()
+        try:
+            model = _get_reopen_model(REOPEN_MODEL_PATH.stat().st_mtime_ns)
+        except FileNotFoundError:
+            return Response(
+                {"error": f"Model not found at {REOPEN_MODEL_PATH}; run scripts/train_reopen_classifier.py first."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+
+        # Trees compare float32 thresholds: one row-major float32 copy
+        X = np.empty((len(feat), len(REOPEN_FEATURES)), dtype=np.float32)
+        for j, col in enumerate(REOPEN_FEATURES):
+            X[:, j] = feat[col].to_numpy()
+        # Counts are always finite; skip sklearn's NaN/inf scan
+        with config_context(assume_finite=True):
+            probas = model.predict_proba(X) if len(X) else np.empty((0, 1))
+        single_class = probas.shape[1] < 2
+        probs = np.zeros(len(feat)) if single_class else probas[:, 1]
+
+        return Response({
+            "total_events": len(df),
+            "single_class": single_class,
+            "cases": [
+                {"case_id": c, "reopen_risk_prob": float(p)}
+                for c, p in zip(feat["case_id"], probs)
+            ],
+        })
+
+
 class PerformanceView(APIView):
     """4) Throughput & conformance (token-replay)."""
     def get(self, request):
-        # Throughput
-        qs = Event.objects.select_related("case").order_by("timestamp")
-        dfc = (pd.DataFrame.from_records(qs.values("case__case_id","timestamp"))
-                 .rename(columns={"case__case_id":"case_id"}))
-        dfc["timestamp"] = pd.to_datetime(dfc.timestamp)
-        starts = dfc.groupby("case_id").timestamp.min().reset_index(name="start_ts")
-        starts["date"] = starts.start_ts.dt.date
-        thr = starts.date.value_counts().sort_index().reset_index(name="count")
-        thr.columns = ["date","count"]
-        throughput = thr.to_dict(orient="records")
+        # Throughput: cases started per day, aggregated in the database
+        with connection.cursor() as cur:
+            cur.execute(
+                "SELECT DATE(first_ts) AS d, COUNT(*) AS c FROM ("
+                "  SELECT MIN(timestamp) AS first_ts FROM events_event GROUP BY case_id"
+                ") sub GROUP BY d ORDER BY d"
+            )
+            # SQLite returns the date as text, Postgres as datetime.date
+            throughput = [{"date": str(d), "count": c} for d, c in cur.fetchall()]
 
         # Conformance
-        qs2 = Event.objects.select_related("case").values(
-            "case__case_id","activity","timestamp","resource"
-        )
-        df = (pd.DataFrame.from_records(qs2)
-              .rename(columns={
-                  "case__case_id":"case:concept:name",
-                  "activity":"concept:name",
-                  "timestamp":"time:timestamp",
-                  "resource":"org:resource"
-              }))
-        df["time:timestamp"] = pd.to_datetime(df["time:timestamp"])
-        df = dataframe_utils.convert_timestamp_columns_in_df(df).sort_values("time:timestamp")
-        log = convert.convert_to_event_log(df)
-
-        net, im, fm = alpha_miner.apply(log)
-        replayed    = token_replay.apply(log, net, im, fm)
+        net, im, fm, replayed = cached_alpha_net()
         total_traces = len(replayed)
 
         if replayed and "trace_is_fitting" in replayed[0]:
@@ -153,12 +279,16 @@ class PerformanceView(APIView):
 class ActivityFrequencyView(APIView):
     """5) Counts per activity per day."""
     def get(self, request):
-        qs = Event.objects.values("activity","timestamp")
-        df = pd.DataFrame.from_records(qs)
-        df["timestamp"] = pd.to_datetime(df.timestamp)
-        df["date"] = df.timestamp.dt.date
-        freq = df.groupby(["activity","date"]).size().reset_index(name="count")
-        return Response({"activity_counts": freq.to_dict(orient="records")})
+        with connection.cursor() as cur:
+            cur.execute(
+                "SELECT activity, DATE(timestamp) AS d, COUNT(*) AS c "
+                "FROM events_event GROUP BY activity, d ORDER BY activity, d"
+            )
+            freq = [
+                {"activity": a, "date": str(d), "count": c}
+                for a, d, c in cur.fetchall()
+            ]
+        return Response({"activity_counts": freq})
 
 
 # Path to your CSV (adjust if yours lives elsewhere)
@@ -169,7 +299,10 @@ def load_event_df():
     Read the single canonical CSV and return a DataFrame
     with the same columns your SQL used to provide.
     """
-    df = pd.read_csv(CSV_PATH, parse_dates=["timestamp"])
+    # Arrow's multithreaded CSV reader, columns kept Arrow-backed
+    df = pd.read_csv(
+        CSV_PATH, parse_dates=["timestamp"], engine="pyarrow", dtype_backend="pyarrow"
+    )
     # If your CSV has different column names, rename here:
     # df = df.rename(columns={"csv_case_id": "case_id", ...})
     return df
@@ -180,16 +313,16 @@ CANONICAL_CSV = Path(__file__).resolve().parents[1] / "data" / "event_logs" / "s
 class RetrainModelView(APIView):
     """
     POST /api/retrain/
-    Re-trains reopen-risk model from a single CSV (admin only).
+    Queues a re-train of the reopen-risk model from a single CSV (admin only).
+    Returns a task id to poll at /api/retrain/<task_id>/.
     """
     permission_classes = [IsAdminUser]
 
     def post(self, request):
         # 1) check script exists
-        script = Path(__file__).resolve().parents[1] / "scripts" / "train_reopen_classifier.py"
-        if not script.exists():
+        if not TRAIN_SCRIPT.exists():
             return Response(
-                {"error": f"Training script not found at {script}"},
+                {"error": f"Training script not found at {TRAIN_SCRIPT}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
@@ -200,24 +333,57 @@ class RetrainModelView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-        # 3) call the script
-        cmd = ["python", str(script), str(CANONICAL_CSV)]
+        # 3) hand the script off to a Celery worker
         try:
-            proc = subprocess.run(cmd, capture_output=True, text=True)
+            task = retrain_task.delay(str(CANONICAL_CSV))
         except Exception as e:
             return Response(
-                {"error": f"Failed to launch training script: {e}"},
+                {"error": f"Failed to queue training task: {e}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        return Response({"task_id": task.id}, status=status.HTTP_202_ACCEPTED)
+
+
+class RetrainStatusView(APIView):
+    """
+    GET /api/retrain/<task_id>/
+    Reports the state of a queued re-train (admin only).
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, task_id):
+        result = AsyncResult(task_id)
+        if not result.ready():
+            return Response(
+                {"task_id": task_id, "status": result.status},
+                status=status.HTTP_202_ACCEPTED
+            )
+
+        # 4) handle result; any finished state but SUCCESS (FAILURE, REVOKED)
+        # carries an exception rather than the task's return value
+        if not result.successful():
+            return Response(
+                {"task_id": task_id, "status": result.status, "error": str(result.result)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-        # 4) handle result
-        if proc.returncode != 0:
+        proc = result.result
+        if proc["returncode"] != 0:
             return Response(
-                {"error": proc.stderr.strip() or "Unknown error during training"},
+                {
+                    "task_id": task_id,
+                    "status": "FAILURE",
+                    "error": proc["stderr"].strip() or "Unknown error during training",
+                },
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
         return Response(
-            {"output": proc.stdout.strip() or "Retraining succeeded"},
+            {
+                "task_id": task_id,
+                "status": result.status,
+                "output": proc["stdout"].strip() or "Retraining succeeded",
+            },
             status=status.HTTP_200_OK
-        )
\ No newline at end of file
+        )
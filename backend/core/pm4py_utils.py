@@ -1,27 +1,204 @@
+import logging
+import os
+import subprocess
+import tempfile
+
+import numpy as np
 import pandas as pd
+from django.core.cache import cache
+from django.db.models import Count, Max
+from joblib import Parallel, delayed
 from events.models import Event
+import pm4py
 from pm4py import convert
-from pm4py.objects.log.util import dataframe_utils
+from pm4py.algo.discovery.alpha.variants import classic as alpha_classic
+from pm4py.visualization.petri_net import visualizer as pn_visualizer
+
+logger = logging.getLogger(__name__)
+
+# Discovery results are reused until the events table changes
+ALPHA_CACHE_TIMEOUT = 3600
+# Only fan token replay out to worker processes above this many cases per job
+REPLAY_CASES_PER_JOB = 1000
+
+def get_event_df():
+    # Fetch all events column-wise instead of as one dict per row.
+    # iterator() streams through a server-side cursor on Postgres and skips
+    # the queryset result cache, so rows aren't held twice.
+    qs = Event.objects.values_list("case__case_id", "activity", "timestamp", "resource")
+    rows = list(qs.iterator(chunk_size=50_000))
+    case_ids, activities, timestamps, resources = zip(*rows) if rows else ((), (), (), ())
+    del rows
+    df = pd.DataFrame({
+        "case:concept:name": case_ids,
+        "concept:name":      activities,
+        "time:timestamp":    pd.to_datetime(timestamps),
+        "org:resource":      resources,
+    }, copy=False)
+    # Few distinct resources repeated per event: store as int codes.
+    # pm4py insists on plain strings for the case id and activity columns.
+    df["org:resource"] = df["org:resource"].astype("category")
+
+    # Chronological order
+    return df.sort_values("time:timestamp")
 
 def get_event_log():
-    # Fetch all events into a DataFrame
-    qs = (
-        Event.objects
-        .select_related("case")
-        .values("case__case_id", "activity", "timestamp", "resource")
+    # Convert DataFrame to PM4Py EventLog
+    return convert.convert_to_event_log(get_event_df())
+
+def directly_follows(df):
+    """
+    Directly-follows, start- and end-activity counts for the α-miner.
+    Activities are factorized to int codes and pairs counted with one
+    np.bincount over an n×n matrix instead of pandas shift/groupby.
+    An empty log gives empty counts.
+    """
+    if df.empty:
+        return {}, {}, {}
+    # Stable sort keeps the chronological order within each case
+    df = df.sort_values("case:concept:name", kind="stable")
+    case_codes = pd.factorize(df["case:concept:name"])[0]
+    act_codes, activities = pd.factorize(df["concept:name"])
+    n_act = len(activities)
+
+    same_case = case_codes[:-1] == case_codes[1:]
+    pairs = act_codes[:-1][same_case] * n_act + act_codes[1:][same_case]
+    matrix = np.bincount(pairs, minlength=n_act * n_act).reshape(n_act, n_act)
+    dfg = {
+        (activities[a], activities[b]): int(matrix[a, b])
+        for a, b in zip(*np.nonzero(matrix))
+    }
+
+    first = np.r_[True, ~same_case]
+    last = np.r_[~same_case, True]
+    starts = np.bincount(act_codes[first], minlength=n_act)
+    ends = np.bincount(act_codes[last], minlength=n_act)
+    start_activities = {activities[i]: int(c) for i, c in enumerate(starts) if c}
+    end_activities = {activities[i]: int(c) for i, c in enumerate(ends) if c}
+    return dfg, start_activities, end_activities
+
+def parallel_token_replay(df, net, im, fm):
+    """
+    Token-based replay with the cases dealt round-robin across worker
+    processes; replay is per-trace, so the chunk results just concatenate.
+    Small logs replay in-process to avoid the worker start-up cost.
+    """
+    case_codes, cases = pd.factorize(df["case:concept:name"])
+    if not len(cases):
+        return []   # nothing to replay; pm4py rejects the untyped empty columns
+    n_jobs = min(os.cpu_count() or 1, len(cases) // REPLAY_CASES_PER_JOB)
+    if n_jobs < 2:
+        return pm4py.conformance_diagnostics_token_based_replay(df, net, im, fm)
+
+    chunks = Parallel(n_jobs=n_jobs, backend="loky")(
+        delayed(pm4py.conformance_diagnostics_token_based_replay)(
+            df[case_codes % n_jobs == i], net, im, fm
+        )
+        for i in range(n_jobs)
     )
-    df = pd.DataFrame.from_records(qs)
-    df = df.rename(columns={
-        "case__case_id": "case:concept:name",
-        "activity":      "concept:name",
-        "timestamp":     "time:timestamp",
-        "resource":      "org:resource",
-    })
-
-    # Ensure datetime type & chronological order
-    df = dataframe_utils.convert_timestamp_columns_in_df(df)
-    df = df.sort_values("time:timestamp")
+    return [trace for chunk in chunks for trace in chunk]
 
-    # Convert DataFrame to PM4Py EventLog
-    event_log = convert.convert_to_event_log(df)
-    return event_log
+def log_version():
+    """Cheap fingerprint of the events table: (max id, row count)."""
+    agg = Event.objects.aggregate(m=Max("id"), c=Count("id"))
+    return f"{agg['m']}:{agg['c']}"
+
+def cached_alpha_net():
+    """
+    Return (net, im, fm, replayed) for the current event log.
+    α-miner discovery and token replay only run on a cache miss.
+    """
+    key = f"alpha:{log_version()}"
+    result = cache.get(key)
+    if result is None:
+        # pm4py works on the DataFrame directly (standard column names),
+        # no intermediate EventLog of per-event objects
+        df = get_event_df()
+        net, im, fm = alpha_classic.apply_dfg_sa_ea(*directly_follows(df))
+        replayed    = parallel_token_replay(df, net, im, fm)
+        result = (net, im, fm, replayed)
+        cache.set(key, result, timeout=ALPHA_CACHE_TIMEOUT)
+    return result
+
+def cached_alpha_dot():
+    """DOT source of the α-miner Petri net, generated once per log version."""
+    key = f"alpha_dot:{log_version()}"
+    dot_src = cache.get(key)
+    if dot_src is None:
+        net, im, fm, _ = cached_alpha_net()
+        dot_src = pn_visualizer.apply(net, im, fm).source
+        cache.set(key, dot_src, timeout=ALPHA_CACHE_TIMEOUT)
+    return dot_src
+
+def _dot_error(proc, stderr_file):
+    """Log a failed `dot` run and return it as a CalledProcessError."""
+    returncode = proc.wait()
+    stderr_file.seek(0)
+    stderr = stderr_file.read().decode(errors="replace").strip()
+    stderr_file.close()
+    logger.error("dot -Tpng exited with status %s: %s", returncode, stderr)
+    return subprocess.CalledProcessError(returncode, proc.args, stderr=stderr)
+
+def alpha_png_stream(chunk_size=65536):
+    """
+    Iterator over the PNG bytes of the α-miner Petri net.
+    A rendered PNG is served from the cache; otherwise `dot -Tpng` output
+    is streamed as it is produced and cached once `dot` exits cleanly.
+    Raises FileNotFoundError if Graphviz is not installed, and
+    CalledProcessError if `dot` fails before producing any output.
+    """
+    png_key = f"alpha_png:{log_version()}"
+    img_bytes = cache.get(png_key)
+    if img_bytes is not None:
+        return iter([img_bytes])
+
+    dot_src = cached_alpha_dot()
+    # stderr goes to a file: a pipe nobody reads could fill up and stall dot
+    stderr_file = tempfile.TemporaryFile()
+    try:
+        proc = subprocess.Popen(
+            ["dot", "-Tpng"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr_file,
+        )
+    except OSError:
+        stderr_file.close()
+        raise
+    try:
+        # dot reads the whole graph before emitting anything, so this can't block
+        proc.stdin.write(dot_src.encode())
+        proc.stdin.close()
+    except BrokenPipeError:
+        pass    # dot exited early; its status and stderr say why
+    # dot only writes once it has rendered, so a failure shows up as no
+    # output, while the response status can still say so
+    first = proc.stdout.read(chunk_size)
+    if not first:
+        proc.stdout.close()
+        raise _dot_error(proc, stderr_file)
+
+    def chunks():
+        parts = [first]
+        try:
+            yield first
+            for chunk in iter(lambda: proc.stdout.read(chunk_size), b""):
+                parts.append(chunk)
+                yield chunk
+        except GeneratorExit:
+            stderr_file.close()     # client went away; dot gets SIGPIPE
+            raise
+        finally:
+            proc.stdout.close()
+            proc.wait()
+        if proc.returncode == 0:
+            stderr_file.close()
+            cache.set(png_key, b"".join(parts), timeout=ALPHA_CACHE_TIMEOUT)
+        else:
+            # Too late to change the status; log it and don't cache the PNG
+            _dot_error(proc, stderr_file)
+
+    return chunks()
+
+def invalidate_alpha_cache():
+    """Drop cached results for the current log version."""
+    version = log_version()
+    cache.delete_many([f"alpha:{version}", f"alpha_dot:{version}", f"alpha_png:{version}"])
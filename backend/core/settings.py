@@ -137,6 +137,23 @@ SIMPLE_JWT = {
      "BLACKLIST_AFTER_ROTATION": True,
  }
 
+# Celery: model retraining runs on a worker, not in the request thread
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
+CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", CELERY_BROKER_URL)
+
+# Discovery results (α-net, replay, PNG) are cached per log version, and a
+# post_save signal drops them on in-place event edits. With several gunicorn
+# workers the cache must be shared, or only the worker that saved the edit
+# forgets; set CACHE_URL to a Redis URL there. Unset, each process keeps its
+# own in-memory cache, which is fine for runserver.
+if os.getenv("CACHE_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["CACHE_URL"],
+        }
+    }
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
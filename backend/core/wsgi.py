@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_wsgi_application()
+
+# Django imports the URLconf (and with it the views and their models) on the
+# first request. Resolve it now, so under gunicorn --preload it happens once
+# in the master and the forked workers share the result.
+from django.urls import get_resolver  # noqa: E402
+
+get_resolver().url_patterns
@@ -1,6 +1,7 @@
 # backend/events/management/commands/load_events.py
 import pandas as pd
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from events.models import Case, Event
 
 class Command(BaseCommand):
@@ -10,12 +11,33 @@ class Command(BaseCommand):
         parser.add_argument("csv_path", type=str, help="Path to your event log CSV")
 
     def handle(self, *args, **options):
-        df = pd.read_csv(options["csv_path"], parse_dates=["timestamp"])
-        for _, row in df.iterrows():
-            case_obj, _ = Case.objects.get_or_create(case_id=row["case_id"])
-            Event.objects.create(
-                case=case_obj,
-                activity=row["activity"],
-                timestamp=row["timestamp"],
+        # case_id stays text, as stored on Case, even when it looks numeric
+        df = pd.read_csv(
+            options["csv_path"], parse_dates=["timestamp"], engine="pyarrow",
+            dtype={"case_id": str},
+        )
+        # Blank or absent resources are stored as "", the field's default
+        df["resource"] = df["resource"].fillna("") if "resource" in df else ""
+
+        # All or nothing, so a bad row doesn't leave the cases half-loaded
+        with transaction.atomic():
+            # One multi-row INSERT for the cases, then map case_id -> pk
+            unique_ids = df["case_id"].unique().tolist()
+            Case.objects.bulk_create(
+                [Case(case_id=c) for c in unique_ids], ignore_conflicts=True
+            )
+            id_map = dict(
+                Case.objects.filter(case_id__in=unique_ids).values_list("case_id", "id")
             )
+
+            events = [
+                Event(
+                    case_id=id_map[r.case_id],
+                    activity=r.activity,
+                    timestamp=r.timestamp,
+                    resource=r.resource,
+                )
+                for r in df.itertuples(index=False)
+            ]
+            Event.objects.bulk_create(events, batch_size=5000)
         self.stdout.write(self.style.SUCCESS(f"Loaded {len(df)} events"))
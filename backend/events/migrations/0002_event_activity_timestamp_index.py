@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-15 08:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['activity', 'timestamp'], name='ev_act_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.3 on 2026-10-15 08:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0002_event_activity_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['case', 'timestamp'], name='ev_case_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['timestamp'], name='ev_ts_idx'),
+        ),
+    ]
@@ -23,6 +23,11 @@ class Event(models.Model):
 
     class Meta:
         ordering = ["timestamp"]  # ensures chronological order
+        indexes = [
+            models.Index(fields=["case", "timestamp"], name="ev_case_ts_idx"),
+            models.Index(fields=["timestamp"], name="ev_ts_idx"),
+            models.Index(fields=["activity", "timestamp"], name="ev_act_ts_idx"),
+        ]
 
     def __str__(self):
         return f"{self.case.case_id} | {self.activity} @ {self.timestamp}"
@@ -0,0 +1,16 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from events.models import Event
+
+
+@receiver(post_save, sender=Event)
+def invalidate_discovery_cache(sender, instance, created, **kwargs):
+    """
+    Inserts and deletes change the (max id, count) log fingerprint on
+    their own; in-place edits don't, so drop the cached α-miner results.
+    """
+    if created:
+        return
+    from core.pm4py_utils import invalidate_alpha_cache
+    invalidate_alpha_cache()
@@ -1,3 +1,42 @@
+import io
+import tempfile
+
+from django.core.management import call_command
+from django.db import IntegrityError
 from django.test import TestCase
 
-# Create your tests here.
+from events.models import Case, Event
+
+
+class LoadEventsTests(TestCase):
+    def load(self, text):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as f:
+            f.write(text)
+            f.flush()
+            call_command("load_events", f.name, stdout=io.StringIO())
+
+    def test_numeric_case_ids_and_blank_resources(self):
+        self.load(
+            "case_id,activity,timestamp,resource\n"
+            "101,Open,2024-01-01T09:00:00Z,alice\n"
+            "101,Close,2024-01-01T10:00:00Z,\n"
+            "102,Open,2024-01-02T09:00:00Z,\n"
+        )
+        self.assertEqual(sorted(Case.objects.values_list("case_id", flat=True)), ["101", "102"])
+        self.assertEqual(
+            list(Event.objects.order_by("timestamp").values_list("case__case_id", "resource")),
+            [("101", "alice"), ("101", ""), ("102", "")],
+        )
+
+    def test_without_resource_column(self):
+        self.load("case_id,activity,timestamp\nc1,Open,2024-01-01T09:00:00Z\n")
+        self.assertEqual(Event.objects.get().resource, "")
+
+    def test_failed_load_inserts_nothing(self):
+        with self.assertRaises(IntegrityError):
+            self.load(
+                "case_id,activity,timestamp,resource\n"
+                "c1,Open,2024-01-01T09:00:00Z,alice\n"
+                "c2,,2024-01-01T10:00:00Z,bob\n"
+            )
+        self.assertFalse(Case.objects.exists())
@@ -1,15 +1,18 @@
 #!/usr/bin/env python3
-import csv
-import random
 from datetime import datetime, timedelta
 from pathlib import Path
 
+import numpy as np
+import pyarrow as pa
+from pyarrow import csv as pacsv
+
 # PARAMETERS
 NUM_CASES       = 500     # number of distinct cases
 MIN_EVENTS      = 20      # min events per case
 MAX_EVENTS      = 80      # max events per case
 START_DATE      = datetime(2024, 1, 1)
 END_DATE        = datetime(2025, 6, 1)
+CASE_WINDOW     = timedelta(days=30)  # all events of a case fall within this span
 ACTIVITIES      = [
     "Create Issue", "Assign Issue", "Start Work",
     "Commit Code", "Code Review", "Resolve Issue",
@@ -18,38 +21,36 @@ ACTIVITIES      = [
 RESOURCES       = [f"user_{i:03d}" for i in range(1, 51)]
 OUTPUT_CSV_PATH = Path("data/event_logs/synthetic_events.csv")
 
-def random_timestamp(start, end):
-    """Return a random datetime between start and end."""
-    delta = end - start
-    return start + timedelta(seconds=random.randint(0, int(delta.total_seconds())))
-
 def main():
     # ensure output dir exists
     OUTPUT_CSV_PATH.parent.mkdir(parents=True, exist_ok=True)
-
-    with OUTPUT_CSV_PATH.open("w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(["case_id", "activity", "timestamp", "resource"])
-
-        for case_num in range(1, NUM_CASES + 1):
-            case_id = f"CASE_{case_num:04d}"
-            # pick a start time for the case
-            case_start = random_timestamp(START_DATE, END_DATE - timedelta(days=30))
-            n_events = random.randint(MIN_EVENTS, MAX_EVENTS)
-
-            # generate events in chronological order
-            timestamps = sorted(
-                random_timestamp(case_start, case_start + timedelta(days=30))
-                for _ in range(n_events)
-            )
-
-            for ts in timestamps:
-                activity = random.choice(ACTIVITIES)
-                resource = random.choice(RESOURCES)
-                writer.writerow([case_id, activity, ts.isoformat(), resource])
+    rng = np.random.default_rng()
+
+    # events per case, and the case each event belongs to
+    n_events = rng.integers(MIN_EVENTS, MAX_EVENTS + 1, size=NUM_CASES)
+    case_idx = np.repeat(np.arange(NUM_CASES), n_events)
+    total    = int(n_events.sum())
+
+    # pick a start time for each case, then every event within CASE_WINDOW of it
+    start_span = int((END_DATE - CASE_WINDOW - START_DATE).total_seconds())
+    window     = int(CASE_WINDOW.total_seconds())
+    case_start = rng.integers(0, start_span + 1, size=NUM_CASES)
+    seconds    = case_start[case_idx] + rng.integers(0, window + 1, size=total)
+
+    # chronological order within each case (case_idx is already grouped)
+    seconds    = seconds[np.lexsort((seconds, case_idx))]
+    timestamps = np.datetime64(START_DATE, "s") + seconds.astype("timedelta64[s]")
+
+    case_ids = np.array([f"CASE_{n:04d}" for n in range(1, NUM_CASES + 1)])
+    table = pa.table({
+        "case_id":   case_ids[case_idx],
+        "activity":  np.array(ACTIVITIES)[rng.integers(0, len(ACTIVITIES), size=total)],
+        "timestamp": timestamps,
+        "resource":  np.array(RESOURCES)[rng.integers(0, len(RESOURCES), size=total)],
+    })
+    pacsv.write_csv(table, OUTPUT_CSV_PATH)
 
     print(f"Synthetic log written to {OUTPUT_CSV_PATH}")
 
 if __name__ == "__main__":
     main()
-
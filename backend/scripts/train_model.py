@@ -7,7 +7,12 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_error, r2_score
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+
+try:
+    from adbc_driver_postgresql import dbapi as adbc
+except ImportError:  # fall back to SQLAlchemy + psycopg2
+    adbc = None
 
 # 0. Load env & build URI
 load_dotenv()
@@ -18,46 +23,42 @@ port   = os.getenv("DB_PORT")
 db     = os.getenv("POSTGRES_DB")
 URI    = f"postgresql://{user}:{pw}@{host}:{port}/{db}"
 
-# 1. Read raw events
-engine = create_engine(URI)
+# 1. Case-level features, aggregated server-side so only one row per case
+#    crosses the wire instead of every event
 query = """
-    SELECT 
-      c.case_id    AS case_id,
-      e.activity   AS activity,
-      e.timestamp  AS timestamp,
-      e.resource   AS resource
+    SELECT
+      c.case_id                   AS case_id,
+      COUNT(*)                    AS total_events,
+      COUNT(DISTINCT e.activity)  AS unique_activities,
+      COUNT(DISTINCT e.resource)  AS unique_resources,
+      MIN(e.timestamp)            AS case_start,
+      MAX(e.timestamp)            AS case_end
     FROM events_event e
     JOIN events_case c ON e.case_id = c.id
+    GROUP BY c.case_id
+    ORDER BY c.case_id
 """
-df = pd.read_sql(query, engine, parse_dates=["timestamp"])
+if adbc is not None:
+    # ADBC fetches straight into Arrow columns; pandas wraps them zero-copy
+    with adbc.connect(f"{URI}?options=-c%20statement_timeout%3D30000") as conn:
+        with conn.cursor() as cur:
+            cur.execute(query)
+            features = cur.fetch_arrow_table().to_pandas(types_mapper=pd.ArrowDtype)
+else:
+    engine = create_engine(URI, connect_args={"options": "-c statement_timeout=30000"})
+    # Server-side cursor: rows arrive in chunks instead of one giant fetchall()
+    with engine.connect().execution_options(stream_results=True) as conn:
+        chunks = pd.read_sql(
+            text(query), conn, chunksize=50_000,
+            parse_dates=["case_start", "case_end"], dtype_backend="pyarrow",
+        )
+        features = pd.concat(chunks, ignore_index=True, copy=False)
 
-# 2. Case-level feature engineering
-# 2a) Compute start / end / duration
-grouped = (
-    df
-    .groupby("case_id")["timestamp"]
-    .agg(start="min", end="max")
-    .reset_index()               # <-- ensure case_id is ONLY a column
-)
-# Duration in hours
-grouped["duration"] = (
-    (grouped["end"] - grouped["start"])
+# 2. Duration in hours
+features["duration"] = (
+    (features["case_end"] - features["case_start"])
     .dt.total_seconds() / 3600
 )
-features = grouped[["case_id", "duration"]]
-
-# 2b) Add count-based features
-feat_counts = (
-    df
-    .groupby("case_id")
-    .agg(
-        total_events      = ("activity", "count"),
-        unique_activities = ("activity", "nunique"),
-        unique_resources  = ("resource", "nunique"),
-    )
-    .reset_index()               # <-- again, case_id as column only
-)
-features = features.merge(feat_counts, on="case_id")
 
 # 3. Split & train
 X = features[["total_events", "unique_activities", "unique_resources"]]
@@ -76,5 +77,6 @@ print("R²:", r2_score(y_test, preds))
 
 # 5. Persist
 os.makedirs("models", exist_ok=True)
-joblib.dump(model, "models/case_duration_rf.joblib")
+# lz4 keeps the file small and is nearly free to decompress on load
+joblib.dump(model, "models/case_duration_rf.joblib", compress=("lz4", 3), protocol=5)
 print("Model saved to models/case_duration_rf.joblib")
@@ -1,22 +1,83 @@
 import os
-from pathlib import Path
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
 
 import numpy as np
 import pandas as pd
-import joblib
 import streamlit as st
 import altair as alt
 import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 from requests.exceptions import HTTPError, ConnectionError
 
 # Load environment vars
 load_dotenv()
 API_URL = os.getenv("API_URL", "http://backend:8000")
+RETRAIN_POLL_TIMEOUT = 600  # seconds to wait on a queued retrain
+API_CACHE_TTL = 300         # seconds to reuse a GET response across reruns
+CHART_MAX_POINTS = 731      # daily points per line before charts bin by week
 
 st.set_page_config(page_title="Process-Mining Prototype", layout="wide")
 
+# --- Shared HTTP session ---
+@st.cache_resource
+def get_session():
+    """One pooled, keep-alive session per server process. Streamlit re-executes
+    this module on every rerun, so a plain module-level Session would be rebuilt
+    (and its connections dropped) each time."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+SESSION = get_session()
+
+# --- Cached API fetches ---
+def _fetch_json(url: str, token: str):
+    r = SESSION.get(url, headers={"Authorization": f"Bearer {token}"}, timeout=5)
+    r.raise_for_status()
+    return r.json()
+
+@st.cache_data(ttl=API_CACHE_TTL, show_spinner=False)
+def cached_json(url: str, token: str) -> dict:
+    """GET JSON with auth. Responses are cached per (url, token): widget
+    reruns don't hit the API, and a new login gets fresh entries. Failed
+    requests raise, so errors are never cached."""
+    return _fetch_json(url, token)
+
+@st.cache_data(ttl=API_CACHE_TTL, show_spinner=False)
+def get_throughput_df(token: str):
+    """Throughput as a date-sorted DataFrame, plus the conformance scores,
+    so reruns skip rebuilding the frame and re-parsing its dates."""
+    perf = cached_json(f"{API_URL}/api/performance/", token)
+    df = pd.DataFrame(perf["throughput"])
+    df["date"] = pd.to_datetime(df["date"], format="ISO8601")
+    return df.sort_values("date", ignore_index=True), perf["conformance"]
+
+@st.cache_resource
+def get_prefetch_pool():
+    """Worker threads for cache warming, shared by all sessions. Fetches
+    submitted here outlive the script run that queued them."""
+    return ThreadPoolExecutor(max_workers=4)
+
+def dashboard_fetches(token: str):
+    """The cached fetches behind a dashboard render, as (fetch, *args)."""
+    return [
+        (get_throughput_df, token),
+        (cached_json, f"{API_URL}/api/metrics/", token),
+        (cached_json, f"{API_URL}/api/activity-frequency/", token),
+    ]
+
+def prefetch(fetches):
+    """Run independent cached fetches concurrently, so a cold rerun waits for
+    the slowest request rather than their sum. Errors are left to surface
+    from the safe_call that later reads the (then cached) result."""
+    pool = get_prefetch_pool()
+    wait([pool.submit(fetch, *args) for fetch, *args in fetches])
+
 # --- Helper for safe rerun ---
 def rerun():
     """Re-run the Streamlit script if supported; otherwise do nothing."""
@@ -39,7 +100,7 @@ if "access_token" not in st.session_state:
     password = st.text_input("Password", type="password", key="login_pw")
     if st.button("Login"):
         try:
-            resp = requests.post(
+            resp = SESSION.post(
                 f"{API_URL}/api/token/",
                 json={"username": username, "password": password},
                 timeout=5
@@ -55,6 +116,10 @@ if "access_token" not in st.session_state:
         tokens = resp.json()
         st.session_state.access_token  = tokens["access"]
         st.session_state.refresh_token = tokens["refresh"]
+        # Start the dashboard's requests now rather than on its first render
+        pool = get_prefetch_pool()
+        for fetch, *args in dashboard_fetches(tokens["access"]):
+            pool.submit(fetch, *args)
         rerun()
 
     st.stop()
@@ -62,12 +127,10 @@ if "access_token" not in st.session_state:
 # --- Authenticated Section ---
 AUTH_HEADERS = {"Authorization": f"Bearer {st.session_state.access_token}"}
 
-def safe_get_json(url: str):
-    """GET JSON with auth; handle HTTP and Connection errors gracefully."""
+def safe_call(fetch, *args):
+    """Run an API fetch; handle HTTP and Connection errors gracefully."""
     try:
-        r = requests.get(url, headers=AUTH_HEADERS, timeout=5)
-        r.raise_for_status()
-        return r.json()
+        return fetch(*args)
     except ConnectionError:
         st.error(f"⚠️ Cannot connect to backend at {API_URL}. Please ensure it’s running.")
         st.stop()
@@ -81,6 +144,46 @@ def safe_get_json(url: str):
             st.error(f"Error fetching data: {e}")
             st.stop()
 
+def safe_get_json(url: str):
+    """GET JSON with auth; handle HTTP and Connection errors gracefully."""
+    return safe_call(cached_json, url, st.session_state.access_token)
+
+@st.cache_data(ttl=API_CACHE_TTL, show_spinner=False)
+def get_process_map(miner: str, token: str) -> bytes:
+    """Process-map PNG for a miner, cached so reopening it skips the backend.
+    The body is read straight off the streamed socket into one bytes object,
+    rather than buffered in chunks and joined as resp.content does."""
+    with SESSION.get(
+        f"{API_URL}/api/process-map/?miner={miner}",
+        headers={"Authorization": f"Bearer {token}"},
+        stream=True,
+        timeout=5,
+    ) as r:
+        r.raise_for_status()
+        return r.raw.read(decode_content=True)
+
+@st.cache_data(ttl=API_CACHE_TTL, show_spinner=False)
+def score_upload(csv_bytes: bytes, filename: str, token: str) -> dict:
+    """POST an event-log CSV to the backend for reopen-risk scoring. Cached on
+    the file contents, so changing top N doesn't upload it again."""
+    r = SESSION.post(
+        f"{API_URL}/api/predict-reopen/",
+        files={"file": (filename, csv_bytes, "text/csv")},
+        headers={"Authorization": f"Bearer {token}"},
+        timeout=60,
+    )
+    r.raise_for_status()
+    return r.json()
+
+# Warm the caches for every GET the sidebar and dashboard make
+token = st.session_state.access_token
+prefetch(dashboard_fetches(token))
+
+# Throughput (also gives the date-filter bounds) and conformance
+df_th_all, conformance = safe_call(get_throughput_df, token)
+min_date = df_th_all["date"].min().date()
+max_date = df_th_all["date"].max().date()
+
 # --- Sidebar: Logout, Retrain, Filters, Navigation ---
 with st.sidebar:
     st.header("⚙️ Menu")
@@ -93,9 +196,25 @@ with st.sidebar:
     if st.button("🚀 Retrain Model"):
         with st.spinner("Retraining..."):
             try:
-                r = requests.post(f"{API_URL}/api/retrain/", headers=AUTH_HEADERS, timeout=5)
+                r = SESSION.post(f"{API_URL}/api/retrain/", headers=AUTH_HEADERS, timeout=5)
                 r.raise_for_status()
-                st.success("🔄 Retraining complete")
+                task_id = r.json()["task_id"]
+
+                # Training runs on a worker; poll until it reports back
+                deadline = time.monotonic() + RETRAIN_POLL_TIMEOUT
+                while r.status_code == 202 and time.monotonic() < deadline:
+                    time.sleep(2)
+                    r = SESSION.get(
+                        f"{API_URL}/api/retrain/{task_id}/", headers=AUTH_HEADERS, timeout=5
+                    )
+                    r.raise_for_status()
+
+                if r.status_code == 202:
+                    st.info(f"⏳ Retraining still running (task {task_id})")
+                else:
+                    # Scores from the old model are stale now
+                    score_upload.clear()
+                    st.success("🔄 Retraining complete")
             except ConnectionError:
                 st.error(f"⚠️ Cannot connect to backend at {API_URL}.")
             except HTTPError as e:
@@ -103,24 +222,31 @@ with st.sidebar:
 
     st.markdown("---")
 
-    # Pre-fetch throughput for date bounds
-    perf_all = safe_get_json(f"{API_URL}/api/performance/")
-    df_th_all = pd.DataFrame(perf_all["throughput"])
-    df_th_all["date"] = pd.to_datetime(df_th_all["date"])
-    min_date = df_th_all["date"].min().date()
-    max_date = df_th_all["date"].max().date()
-
     st.subheader("🔎 Filters")
-    date_range = st.date_input(
-        "Date range",
-        [min_date, max_date],
-        min_value=min_date,
-        max_value=max_date
+    metrics_payload = safe_get_json(f"{API_URL}/api/metrics/")
+    activities = [rec["activity"] for rec in metrics_payload["bottleneck"]]
+
+    # Widgets in a form don't rerun the script until Apply is pressed, so a
+    # batch of filter tweaks costs one rerun instead of one per change
+    with st.form("filters"):
+        date_range = st.date_input(
+            "Date range",
+            [min_date, max_date],
+            min_value=min_date,
+            max_value=max_date
+        )
+        activity_sel = st.multiselect("Activities", activities, default=activities)
+        submitted = st.form_submit_button("Apply")
+    # Keep the last applied filters; a half-picked date range isn't applied
+    if submitted and len(date_range) == 2:
+        st.session_state.applied_filters = (tuple(date_range), activity_sel)
+    date_range, activity_sel = st.session_state.setdefault(
+        "applied_filters", ((min_date, max_date), activities)
     )
-
-    bot = safe_get_json(f"{API_URL}/api/metrics/")["bottleneck"]
-    activities = [rec["activity"] for rec in bot]
-    activity_sel = st.multiselect("Activities", activities, default=activities)
+    # Half-open [date_lo, date_end) bounds as datetime64, so filtering compares
+    # int64 timestamps instead of date objects
+    date_lo = np.datetime64(date_range[0])
+    date_end = np.datetime64(date_range[1]) + np.timedelta64(1, "D")
 
     st.markdown("---")
     page = st.radio("Navigate to", ["Dashboard", "Upload & Predict Risk"])
@@ -138,15 +264,39 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+def activity_mask(activity: pd.Series, selected) -> np.ndarray:
+    """Boolean mask of rows whose activity is selected. Activities are few
+    and repeated, so compare int codes rather than strings per row."""
+    cat = activity.astype("category").cat
+    sel_codes = cat.categories.get_indexer(selected)
+    return np.isin(cat.codes.to_numpy(), sel_codes[sel_codes >= 0], kind="sort")
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def df_to_csv_bytes(df: pd.DataFrame) -> bytes:
+    """CSV payload for a download button. Cached on the frame's contents, so
+    reruns with unchanged filters don't re-encode it."""
+    return df.to_csv(index=False).encode("utf-8")
+
+def chart_bins(df: pd.DataFrame, by=()) -> pd.DataFrame:
+    """Daily counts as sent to the browser. Series longer than
+    CHART_MAX_POINTS days are summed into weekly bins, so the chart's JSON
+    grows with the number of weeks shown rather than with the date range."""
+    if df["date"].nunique() <= CHART_MAX_POINTS:
+        return df.reset_index(drop=True)
+    return (
+        df.groupby([*by, pd.Grouper(key="date", freq="W")], observed=True)["count"]
+          .sum()
+          .reset_index()
+    )
+
 # --- Dashboard Page ---
-def dashboard_page():
+def dashboard_page(data):
     st.header("🔍 Dashboard")
 
-    # 1) Metrics & Bottleneck
-    data = safe_get_json(f"{API_URL}/api/metrics/")
+    # 1) Metrics & Bottleneck (payload already fetched for the sidebar)
     metrics = data["metrics"]
     bottleneck_df = pd.DataFrame(data["bottleneck"])
-    bottleneck_df = bottleneck_df[bottleneck_df["activity"].isin(activity_sel)]
+    bottleneck_df = bottleneck_df[activity_mask(bottleneck_df["activity"], activity_sel)]
 
     c1, c2, c3, c4 = st.columns(4)
     c1.metric("Cases", metrics["total_cases"])
@@ -156,8 +306,10 @@ def dashboard_page():
 
     # Bottleneck chart
     st.subheader("⏳ Top Bottlenecks (Avg Hours)")
+    # Filtered frames carry a sparse Int64 index that Streamlit would ship to
+    # the browser as an extra Arrow column; charts get a plain RangeIndex
     chart_bot = (
-        alt.Chart(bottleneck_df.head(10))
+        alt.Chart(bottleneck_df.head(10).reset_index(drop=True))
             .mark_bar()
             .encode(
                 x=alt.X("activity:N", sort=None, title="Activity"),
@@ -168,21 +320,18 @@ def dashboard_page():
     st.altair_chart(chart_bot, use_container_width=True)
     st.download_button(
         "Download Bottleneck CSV",
-        bottleneck_df.to_csv(index=False).encode("utf-8"),
+        df_to_csv_bytes(bottleneck_df),
         "bottleneck.csv",
         "text/csv"
     )
 
     # 2) Throughput Over Time
     st.subheader("📈 Throughput Over Time")
-    df_th = df_th_all.copy()
-    mask = (
-        (df_th["date"].dt.date >= date_range[0]) &
-        (df_th["date"].dt.date <= date_range[1])
-    )
-    df_th = df_th[mask]
+    # Throughput is kept in date order: slice by position, no mask
+    lo, hi = np.searchsorted(df_th_all["date"].values, [date_lo, date_end])
+    df_th = df_th_all.iloc[lo:hi]
     chart_th = (
-        alt.Chart(df_th)
+        alt.Chart(chart_bins(df_th))
             .mark_line(point=True)
             .encode(
                 x=alt.X("date:T", title="Date"),
@@ -193,27 +342,25 @@ def dashboard_page():
     st.altair_chart(chart_th, use_container_width=True)
     st.download_button(
         "Download Throughput CSV",
-        df_th.to_csv(index=False).encode("utf-8"),
+        df_to_csv_bytes(df_th),
         "throughput.csv",
         "text/csv"
     )
 
     # Conformance
     st.markdown("**Conformance Scores**")
-    st.json(perf_all["conformance"])
+    st.json(conformance)
 
     # 3) Activity Frequency
     st.subheader("📊 Activity Frequency Over Time")
     freq = safe_get_json(f"{API_URL}/api/activity-frequency/")
     df_freq = pd.DataFrame(freq["activity_counts"])
-    df_freq["date"] = pd.to_datetime(df_freq["date"])
-    mask_f = (
-        (df_freq["date"].dt.date >= date_range[0]) &
-        (df_freq["date"].dt.date <= date_range[1])
-    )
-    df_freq = df_freq[mask_f & df_freq["activity"].isin(activity_sel)]
+    df_freq["date"] = pd.to_datetime(df_freq["date"], format="ISO8601", cache=True)
+    freq_dates = df_freq["date"].values
+    mask_f = (freq_dates >= date_lo) & (freq_dates < date_end)
+    df_freq = df_freq[mask_f & activity_mask(df_freq["activity"], activity_sel)]
     chart_freq = (
-        alt.Chart(df_freq)
+        alt.Chart(chart_bins(df_freq, by=["activity"]))
             .mark_line()
             .encode(
                 x=alt.X("date:T", title="Date"),
@@ -225,7 +372,7 @@ def dashboard_page():
     st.altair_chart(chart_freq, use_container_width=True)
     st.download_button(
         "Download Activity Frequency CSV",
-        df_freq.to_csv(index=False).encode("utf-8"),
+        df_to_csv_bytes(df_freq),
         "activity_frequency.csv",
         "text/csv"
     )
@@ -235,13 +382,7 @@ def dashboard_page():
     miner = st.selectbox("Choose Miner", ["alpha", "heuristic", "inductive"])
     if st.button("Load Process Map"):
         try:
-            resp = requests.get(
-                f"{API_URL}/api/process-map/?miner={miner}",
-                headers=AUTH_HEADERS,
-                timeout=5
-            )
-            resp.raise_for_status()
-            img = resp.content
+            img = get_process_map(miner, st.session_state.access_token)
             if img:
                 try:
                     st.image(img,
@@ -271,41 +412,40 @@ def upload_page():
         st.info("Awaiting CSV upload.")
         return
 
-    df = pd.read_csv(uploaded, parse_dates=["timestamp"])
-    st.write(f"Loaded {df['case_id'].nunique()} cases and {len(df)} events.")
-
-    feat = df.groupby("case_id").agg(
-        total_events     = ("activity","count"),
-        unique_acts      = ("activity","nunique"),
-        unique_resources = ("resource","nunique")
-    ).reset_index()
-
-    # locate model: two levels up from this file
-    project_root = Path(__file__).resolve().parent.parent
-    model_path   = project_root / "backend" / "models" / "reopen_risk_rf.joblib"
-
-    st.write("🔍 Loading model from:", model_path)
-    if not model_path.exists():
-        st.error(f"❌ Model not found at {model_path}\nRun `scripts/train_reopen_classifier.py` first.")
+    # Feature engineering and the model live in the backend; send the raw CSV
+    try:
+        scored = score_upload(uploaded.getvalue(), uploaded.name, st.session_state.access_token)
+    except ConnectionError:
+        st.error(f"⚠️ Cannot connect to backend at {API_URL}.")
+        return
+    except HTTPError as e:
+        try:
+            detail = e.response.json()["error"]
+        except (ValueError, KeyError):
+            detail = e
+        st.error(f"❌ Scoring failed: {detail}")
         return
 
-    model = joblib.load(model_path)
-
-    X = feat[["total_events","unique_acts","unique_resources"]]
-    probas = model.predict_proba(X)
-    if probas.shape[1] > 1:
-        feat["reopen_risk_prob"] = probas[:,1]
-    else:
+    cases = scored["cases"]
+    st.write(f"Loaded {len(cases)} cases and {scored['total_events']} events.")
+    if scored["single_class"]:
         st.warning("⚠️ Model only supports one class; assigning 0% reopen risk.")
-        feat["reopen_risk_prob"] = np.zeros(len(feat))
+    case_ids = np.array([c["case_id"] for c in cases], dtype=object)
+    probs = np.fromiter((c["reopen_risk_prob"] for c in cases), dtype=np.float64, count=len(cases))
 
     top_n = st.number_input("Show top N high-risk cases", 5, 50, 10)
-    result = (
-        feat.sort_values("reopen_risk_prob", ascending=False)
-            .head(top_n)
-            .assign(
-                reopen_risk=lambda d: (d.reopen_risk_prob*100).round(1).astype(str)+"%"
-            )
+    # Select the top N in O(n) with argpartition, then order just those
+    k = min(int(top_n), len(probs))
+    idx = np.argpartition(-probs, k - 1)[:k] if k < len(probs) else np.arange(k)
+    idx = idx[np.argsort(-probs[idx], kind="stable")]
+    # Format only the top-N rows, straight from the NumPy array
+    probs_top = probs[idx]
+    result = pd.DataFrame(
+        {
+            "case_id":     case_ids[idx],
+            "reopen_risk": np.char.add(np.round(probs_top*100, 1).astype(str), "%"),
+        },
+        index=idx,
     )
 
     st.subheader("Top High-Risk Cases")
@@ -313,6 +453,6 @@ def upload_page():
 
 # Render
 if page == "Dashboard":
-    dashboard_page()
+    dashboard_page(metrics_payload)
 else:
     upload_page()